@@ -1,24 +1,114 @@
 import asyncio
 import logging
+import logging.handlers
 import os
+import queue
+import shutil
+import tempfile
+import threading
 import zipfile
 from datetime import datetime
 from pathlib import Path
+from typing import IO
 
 import discord
 from dotenv import load_dotenv
 
-from src.bot.helper import BotHelper
+from src.bot.helper import BotHelper, GuildState
 from src.config.cliargs import CLIArgs
 from src.utils.commandline import CommandLine
 from src.utils.pdf_generator import pdf_generator
 
 load_dotenv()
-DISCORD_BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
 PLAYER_MAP_FILE_PATH = os.getenv("PLAYER_MAP_FILE_PATH")
 
 logger = logging.getLogger()  # root logger
 
+# Already-compressed formats gain nothing from DEFLATE, so they are stored as-is
+INCOMPRESSIBLE_EXTS = frozenset({
+    ".mp3", ".opus", ".wav", ".ogg", ".pdf", ".zip", ".png", ".jpg",
+})
+ZIP_COPY_BUFFER_SIZE = 1024 * 1024
+# The ZIP fallback is built in memory and only spills to disk beyond this size
+ZIP_SPOOL_MAX_SIZE = 64 * 1024 * 1024
+# Headroom per ZIP entry (local header, zip64 extra, central directory record) and for the
+# end-of-archive records, so files that fit on raw size also fit once zipped
+ZIP_ENTRY_OVERHEAD = 1024
+ZIP_ARCHIVE_OVERHEAD = 1024
+# Parallel artifact uploads, kept low to stay inside Discord's per-channel rate limit
+ARTIFACT_UPLOAD_CONCURRENCY = max(1, int(os.getenv("ARTIFACT_UPLOAD_CONCURRENCY", "4")))
+DISCORD_MAX_FILES_PER_MESSAGE = 10
+# Optionally post artifacts through a channel webhook, which is rate limited separately
+ARTIFACT_UPLOAD_WEBHOOK = os.getenv("ARTIFACT_UPLOAD_WEBHOOK", "false").lower() == "true"
+ARTIFACT_WEBHOOK_NAME = "volo-artifacts"
+WEBHOOK_UPLOAD_CONCURRENCY = 20
+
+
+_HELP_EMBED = discord.Embed(
+    title="VOLO Help",
+    description="Available commands",
+    color=discord.Color.blue(),
+    fields=[
+        discord.EmbedField(
+            name="/connect", value="Connect to your voice channel.", inline=True),
+        discord.EmbedField(
+            name="/disconnect", value="Disconnect from your voice channel.", inline=True),
+        discord.EmbedField(
+            name="/start_recording", value="Start transcribing the voice channel.", inline=True),
+        discord.EmbedField(
+            name="/stop_recording", value="Stop the active transcription.", inline=True),
+        discord.EmbedField(
+            name="/language", value="Set transcription language (auto/de/eng).", inline=True),
+        discord.EmbedField(
+            name="/generate_pdf", value="Generate a PDF of the transcriptions.", inline=True),
+        discord.EmbedField(
+            name="/help", value="Show the help message.", inline=True),
+    ],
+)
+
+
+class BufferedFileHandler(logging.FileHandler):
+    """
+    A FileHandler that batches writes in a large buffer instead of flushing every record.
+
+    A daemon thread flushes the buffer every `flush_interval` seconds, so idle periods
+    do not hold records back. ERROR and above are flushed immediately, and the rest
+    when the handler is closed at shutdown.
+    """
+
+    def __init__(self, filename, mode='a', buffer_size=65536, flush_interval=30.0, **kwargs):
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        super().__init__(filename, mode, **kwargs)
+        self._stop_flusher = threading.Event()
+        self._flusher = threading.Thread(
+            target=self._flush_periodically, name="log-flusher", daemon=True
+        )
+        self._flusher.start()
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=self.buffer_size,
+                    encoding=self.encoding, errors=self.errors)
+
+    def _flush_periodically(self):
+        while not self._stop_flusher.wait(self.flush_interval):
+            self.flush()
+
+    def emit(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+            return
+        if record.levelno >= logging.ERROR:
+            self.flush()
+
+    def close(self):
+        self._stop_flusher.set()
+        super().close()
+
 
 def configure_logging():
     logging.getLogger('discord').setLevel(logging.WARNING)
@@ -29,35 +119,28 @@ def configure_logging():
 
     # Ensure the directory exists
     log_directory = '.logs/transcripts'
-    pdf_directory = '.logs/pdfs'
-    os.makedirs(log_directory, exist_ok=True) 
-    os.makedirs(pdf_directory, exist_ok=True)  
+    os.makedirs(log_directory, exist_ok=True)
 
     # Get the current date for the log file name
     current_date = datetime.now().strftime('%Y-%m-%d')
     log_filename = os.path.join(log_directory, f"{current_date}-transcription.log")
 
     # Custom logging format (date with milliseconds, message)
-    log_format = '%(asctime)s %(name)s: %(message)s'
-    date_format = '%Y-%m-%d %H:%M:%S.%f'[:-3]  # Trim to milliseconds
-
-    if CLIArgs.verbose:
-        logger.setLevel(logging.DEBUG)
-        logging.basicConfig(level=logging.DEBUG,
-                            format=log_format,
-                            datefmt=date_format)
-    else:
-        logger.setLevel(logging.INFO)
-        logging.basicConfig(level=logging.INFO,
-                            format=log_format,
-                            datefmt=date_format)
-    
+    log_format = '%(asctime)s.%(msecs)03d %(name)s: %(message)s'
+    date_format = '%Y-%m-%d %H:%M:%S'
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(log_format, datefmt=date_format))
+    logger.addHandler(stream_handler)
+    logger.setLevel(logging.DEBUG if CLIArgs.verbose else logging.INFO)
+
     # Set up the transcription logger
     transcription_logger = logging.getLogger('transcription')
     transcription_logger.setLevel(logging.INFO)
 
-    # File handler for transcription logs (append mode)
-    file_handler = logging.FileHandler(log_filename, mode='a')
+    # Buffered file handler for transcription logs (append mode)
+    # The file is only opened once the first transcription is written
+    file_handler = BufferedFileHandler(log_filename, mode='a', delay=True, encoding='utf-8')
     file_handler.setLevel(logging.INFO)
     
     # Custom formatter WITHOUT the automatic timestamp
@@ -65,34 +148,40 @@ def configure_logging():
         '%(message)s'  # Only log the custom message, no automatic timestamp
     ))
 
-    # Add the handler to the transcription logger
-    transcription_logger.addHandler(file_handler)
+    # Hand records to a background listener so file writes never block the event loop
+    log_queue = queue.SimpleQueue()
+    transcription_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    # Transcripts only go to the file, not through the root stream handler as well
+    transcription_logger.propagate = False
+    listener = logging.handlers.QueueListener(
+        log_queue, file_handler, respect_handler_level=True
+    )
+    listener.start()
+    return listener
 
 
 def _get_stop_error_message(bot, ctx: discord.context.ApplicationContext) -> str | None:
-    helper = bot.guild_to_helper.get(ctx.guild_id, None)
-    if not helper:
+    state = bot.guild_state.get(ctx.guild_id)
+    if state is None or not state.vc:
         return "I am not connected to your voice channel."
 
-    if not helper.vc:
-        return "I am not connected to your voice channel."
-
-    if not bot.guild_is_recording.get(ctx.guild_id, False):
+    if not state.is_recording:
         return "No active recording is running."
 
     return None
 
 
 async def _stop_recording_for_guild(bot, ctx: discord.context.ApplicationContext) -> None:
-    await bot.get_transcription(ctx)
     bot.stop_recording(ctx)
     await bot.get_transcription(ctx)
-    bot.guild_is_recording[ctx.guild_id] = False
+    state = bot.guild_state.get(ctx.guild_id)
+    if state:
+        state.is_recording = False
 
 
-def _finalize_session_and_collect_artifacts(bot, session) -> tuple[str, list[Path]]:
+async def _finalize_session_and_collect_artifacts(bot, session) -> tuple[str, list[Path]]:
     try:
-        bot.finalize_session(session)
+        await bot.finalize_session(session)
     except Exception as e:
         logger.error(f"Audio export failed for session {session.session_id}: {e}")
         stop_message = (
@@ -108,77 +197,258 @@ def _finalize_session_and_collect_artifacts(bot, session) -> tuple[str, list[Pat
     return stop_message, bot.get_session_artifact_paths(session)
 
 
-async def _post_session_artifacts(channel, session_id: str, artifact_paths: list[Path]) -> None:
+async def _post_session_artifacts(
+    bot,
+    channel,
+    session_id: str,
+    artifact_paths: list[Path],
+) -> None:
     if not channel or not artifact_paths:
         return
 
-    failed_artifacts = await _upload_artifact_files(channel, session_id, artifact_paths)
+    # Webhooks have their own rate-limit bucket and accept the same send() arguments
+    destination, concurrency = channel, ARTIFACT_UPLOAD_CONCURRENCY
+    if ARTIFACT_UPLOAD_WEBHOOK:
+        webhook = await _get_artifact_webhook(bot, channel)
+        if webhook:
+            destination, concurrency = webhook, WEBHOOK_UPLOAD_CONCURRENCY
+
+    size_limit = channel.guild.filesize_limit
+    failed_artifacts, webhook_gone = await _upload_artifact_files(
+        destination, session_id, artifact_paths, size_limit, concurrency
+    )
+    if webhook_gone:
+        # Deleted or revoked: forget the cached webhook and send through the channel instead
+        logger.warning(f"Artifact webhook for channel {channel.id} is no longer usable.")
+        state = bot.guild_state.get(channel.guild.id)
+        if state:
+            state.artifact_webhook = None
+        failed_artifacts, _ = await _upload_artifact_files(
+            channel, session_id, failed_artifacts, size_limit, ARTIFACT_UPLOAD_CONCURRENCY
+        )
     if not failed_artifacts:
         return
 
-    zip_uploaded = await _upload_zip_fallback(channel, session_id, failed_artifacts)
-    await _post_upload_failure_notice(channel, session_id, failed_artifacts, zip_uploaded)
+    # A ZIP of files that already exceed the upload limit would only fail again
+    zippable, too_large = _split_by_upload_limit(failed_artifacts, channel.guild.filesize_limit)
+    if zippable:
+        zip_uploaded = await _upload_zip_fallback(channel, session_id, zippable)
+        await _post_upload_failure_notice(channel, session_id, zippable, zip_uploaded)
+    if too_large:
+        await _post_upload_failure_notice(channel, session_id, too_large, zip_uploaded=False)
 
 
-async def _upload_artifact_files(channel, session_id: str, artifact_paths: list[Path]) -> list[Path]:
-    failed_artifacts: list[Path] = []
+def _split_by_upload_limit(artifact_paths: list[Path], size_limit: int) -> tuple[list[Path], list[Path]]:
+    zippable: list[Path] = []
+    too_large: list[Path] = []
+    total_size = ZIP_ARCHIVE_OVERHEAD
     for artifact_path in artifact_paths:
-        if await _try_upload_artifact(channel, session_id, artifact_path):
+        try:
+            size = artifact_path.stat().st_size
+        except OSError:
+            too_large.append(artifact_path)
+            continue
+        size += ZIP_ENTRY_OVERHEAD
+        if total_size + size > size_limit:
+            too_large.append(artifact_path)
             continue
-        failed_artifacts.append(artifact_path)
-    return failed_artifacts
+        total_size += size
+        zippable.append(artifact_path)
+    return zippable, too_large
 
 
-async def _try_upload_artifact(channel, session_id: str, artifact_path: Path) -> bool:
+async def _get_artifact_webhook(bot, channel) -> discord.Webhook | None:
+    state = bot.guild_state.get(channel.guild.id)
+    if state is None:
+        return None
+    if state.artifact_webhook and state.artifact_webhook.channel_id == channel.id:
+        return state.artifact_webhook
+
     try:
-        await channel.send(
-            content=f"Session `{session_id}`: `{artifact_path.name}`",
-            file=discord.File(str(artifact_path), filename=artifact_path.name),
+        webhook = next(
+            (
+                hook for hook in await channel.webhooks()
+                if hook.name == ARTIFACT_WEBHOOK_NAME and hook.token
+            ),
+            None,
         )
-        return True
+        if webhook is None:
+            webhook = await channel.create_webhook(name=ARTIFACT_WEBHOOK_NAME)
     except Exception as e:
-        logger.error(f"Failed to upload session artifact {artifact_path}: {e}")
-        return False
+        logger.warning(f"Could not set up artifact webhook for channel {channel.id}: {e}")
+        return None
+
+    state.artifact_webhook = webhook
+    return webhook
+
+
+def _batch_by_upload_limit(
+    artifact_paths: list[Path], size_limit: int
+) -> tuple[list[list[Path]], list[Path]]:
+    """Group files into messages that stay under the size limit; oversized files are returned apart."""
+    batches: list[list[Path]] = []
+    oversized: list[Path] = []
+    batch: list[Path] = []
+    batch_size = 0
+    for artifact_path in artifact_paths:
+        try:
+            size = artifact_path.stat().st_size
+        except OSError:
+            oversized.append(artifact_path)
+            continue
+        if size > size_limit:
+            oversized.append(artifact_path)
+            continue
+        if batch and (len(batch) >= DISCORD_MAX_FILES_PER_MESSAGE or batch_size + size > size_limit):
+            batches.append(batch)
+            batch, batch_size = [], 0
+        batch.append(artifact_path)
+        batch_size += size
+    if batch:
+        batches.append(batch)
+    return batches, oversized
+
+
+async def _upload_artifact_files(
+    channel,
+    session_id: str,
+    artifact_paths: list[Path],
+    size_limit: int,
+    concurrency: int = ARTIFACT_UPLOAD_CONCURRENCY,
+) -> tuple[list[Path], bool]:
+    """Upload the files; returns those that failed and whether a webhook destination is gone."""
+    upload_slots = asyncio.Semaphore(concurrency)
+    # Files over the limit would only be rejected, so they go straight to the failure notice
+    batches, failed_artifacts = _batch_by_upload_limit(artifact_paths, size_limit)
+    results = await asyncio.gather(
+        *(
+            _upload_artifact_batch(upload_slots, channel, session_id, batch)
+            for batch in batches
+        ),
+        return_exceptions=True,
+    )
+    webhook_gone = False
+    for batch, result in zip(batches, results):
+        if isinstance(result, (discord.NotFound, discord.Forbidden)):
+            webhook_gone = True
+            failed_artifacts.extend(batch)
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            failed_artifacts.extend(result)
+    return failed_artifacts, webhook_gone
 
 
-def _build_session_zip_path(session_id: str) -> Path:
-    export_dir = Path(".logs/session_exports")
-    export_dir.mkdir(parents=True, exist_ok=True)
-    return export_dir / f"{session_id}_artifacts.zip"
+async def _upload_artifact_batch(
+    upload_slots: asyncio.Semaphore,
+    channel,
+    session_id: str,
+    batch: list[Path],
+) -> list[Path]:
+    if await _try_upload_artifacts(upload_slots, channel, session_id, batch):
+        return []
+    if len(batch) == 1:
+        return batch
+
+    # Retry one by one to find out which files Discord rejected
+    results = await asyncio.gather(*(
+        _try_upload_artifacts(upload_slots, channel, session_id, [artifact_path])
+        for artifact_path in batch
+    ))
+    return [
+        artifact_path
+        for artifact_path, uploaded in zip(batch, results)
+        if not uploaded
+    ]
 
 
-def _create_artifact_zip(session_id: str, artifact_paths: list[Path]) -> Path | None:
-    zip_path = _build_session_zip_path(session_id)
+def _open_artifact_files(artifact_paths: list[Path]) -> list[discord.File]:
+    artifact_files: list[discord.File] = []
     try:
-        if zip_path.exists():
-            zip_path.unlink()
-        with zipfile.ZipFile(zip_path, mode="w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+        for artifact_path in artifact_paths:
+            artifact_files.append(discord.File(str(artifact_path), filename=artifact_path.name))
+    except Exception:
+        for artifact_file in artifact_files:
+            artifact_file.close()
+        raise
+    return artifact_files
+
+
+async def _try_upload_artifacts(
+    upload_slots: asyncio.Semaphore,
+    channel,
+    session_id: str,
+    artifact_paths: list[Path],
+) -> bool:
+    async with upload_slots:
+        artifact_files: list[discord.File] = []
+        try:
+            # Opening the files happens on a worker thread so the loop keeps serving uploads
+            artifact_files = await asyncio.to_thread(_open_artifact_files, artifact_paths)
+            artifact_names = ", ".join(f"`{file.filename}`" for file in artifact_files)
+            await channel.send(
+                content=f"Session `{session_id}`: {artifact_names}",
+                files=artifact_files,
+            )
+            return True
+        except Exception as e:
+            if isinstance(channel, discord.Webhook) and isinstance(
+                e, (discord.NotFound, discord.Forbidden)
+            ):
+                # Every further send would fail the same way; let the caller switch destination
+                raise
+            logger.error(f"Failed to upload session artifacts {artifact_paths}: {e}")
+            return False
+        finally:
+            for artifact_file in artifact_files:
+                artifact_file.close()
+
+
+def _write_zip_entry(zip_file: zipfile.ZipFile, artifact_path: Path) -> None:
+    if artifact_path.suffix.lower() not in INCOMPRESSIBLE_EXTS:
+        # Small text artifacts, deflated at the archive's compresslevel
+        zip_file.write(artifact_path, arcname=artifact_path.name)
+        return
+
+    # Opus audio benefits most here: unbuffered 1 MiB reads straight into the stored entry
+    info = zipfile.ZipInfo.from_file(artifact_path, arcname=artifact_path.name)
+    info.compress_type = zipfile.ZIP_STORED
+    with open(artifact_path, "rb", buffering=0) as src, zip_file.open(info, "w", force_zip64=True) as dst:
+        shutil.copyfileobj(src, dst, length=ZIP_COPY_BUFFER_SIZE)
+
+
+def _create_artifact_zip(session_id: str, artifact_paths: list[Path]) -> IO[bytes] | None:
+    zip_buffer = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_SIZE)
+    try:
+        with zipfile.ZipFile(
+            zip_buffer, mode="w", compression=zipfile.ZIP_DEFLATED, compresslevel=1
+        ) as zip_file:
             for artifact_path in artifact_paths:
-                zip_file.write(artifact_path, arcname=artifact_path.name)
+                _write_zip_entry(zip_file, artifact_path)
     except Exception as e:
         logger.error(f"Failed to create artifact ZIP for session {session_id}: {e}")
-        if zip_path.exists():
-            zip_path.unlink(missing_ok=True)
+        zip_buffer.close()
         return None
-    return zip_path
+    zip_buffer.seek(0)
+    return zip_buffer
 
 
 async def _upload_zip_fallback(channel, session_id: str, artifact_paths: list[Path]) -> bool:
-    zip_path = _create_artifact_zip(session_id, artifact_paths)
-    if not zip_path:
+    zip_buffer = await asyncio.to_thread(_create_artifact_zip, session_id, artifact_paths)
+    if zip_buffer is None:
         return False
 
     try:
         await channel.send(
             content=f"Session `{session_id}`: ZIP-Fallback mit fehlgeschlagenen Dateien",
-            file=discord.File(str(zip_path), filename=zip_path.name),
+            file=discord.File(zip_buffer, filename=f"{session_id}_artifacts.zip"),
         )
         return True
     except Exception as e:
         logger.error(f"Failed to upload ZIP fallback for session {session_id}: {e}")
         return False
     finally:
-        zip_path.unlink(missing_ok=True)
+        zip_buffer.close()
 
 
 async def _post_upload_failure_notice(
@@ -201,27 +471,16 @@ async def _post_upload_failure_notice(
     )
 
 
-if __name__ == "__main__":
-    args = CommandLine.read_command_line()
-    CLIArgs.update_from_args(args)
-
-    configure_logging()
-    loop = asyncio.get_event_loop()
-    
-    from src.bot.volo_bot import VoloBot  
-    
-    bot = VoloBot(loop)
-
+def register_commands(bot) -> None:
     @bot.event
     async def on_voice_state_update(member, before, after):
         if member.id == bot.user.id:
             # If the bot left the "before" channel
             if after.channel is None:
                 guild_id = before.channel.guild.id
-                helper = bot.guild_to_helper.get(guild_id, None)
-                if helper:
-                    helper.set_vc(None)
-                    bot.guild_to_helper.pop(guild_id, None)
+                state = bot.guild_state.pop(guild_id, None)
+                if state:
+                    state.helper.set_vc(None)
 
                 bot._close_and_clean_sink_for_guild(guild_id)
 
@@ -235,17 +494,16 @@ if __name__ == "__main__":
             await ctx.respond("You need to join a voice channel first.", ephemeral=True)
             return
         # check if we are already connected to a voice channel
-        if bot.guild_to_helper.get(ctx.guild_id, None):
+        if ctx.guild_id in bot.guild_state:
             await ctx.respond("I am already connected in this server.", ephemeral=True)
             return
-        await ctx.trigger_typing()
         try:
             guild_id = ctx.guild_id
             vc = await author_vc.channel.connect()
-            helper = bot.guild_to_helper.get(guild_id, BotHelper(bot))
+            helper = BotHelper(bot)
             helper.guild_id = guild_id
             helper.set_vc(vc)
-            bot.guild_to_helper[guild_id] = helper
+            bot.guild_state[guild_id] = GuildState(helper)
             await ctx.respond("Connected to your voice channel.", ephemeral=False)
             await ctx.guild.change_voice_state(channel=author_vc.channel, self_mute=True)
         except Exception as e:
@@ -268,17 +526,17 @@ if __name__ == "__main__":
 
     @bot.slash_command(name="start_recording", description="Start transcribing this voice channel.")
     async def start_recording(ctx: discord.context.ApplicationContext):
-        await ctx.trigger_typing()
-        connect_command = next((cmd for cmd in ctx.bot.application_commands if cmd.name == "connect"), None)
-        if not connect_command:
+        connect_command_id = bot.get_command_id("connect")
+        if not connect_command_id:
             connect_text = "`/connect`"
         else:
-            connect_text = f"</connect:{connect_command.id}>"
-        if not bot.guild_to_helper.get(ctx.guild_id, None):
+            connect_text = f"</connect:{connect_command_id}>"
+        state = bot.guild_state.get(ctx.guild_id)
+        if not state:
             await ctx.respond(f"I am not connected. Use {connect_text} first.", ephemeral=True)
             return
         # check if recording is already active
-        if bot.guild_is_recording.get(ctx.guild_id, False):
+        if state.is_recording:
             await ctx.respond("Recording is already running.", ephemeral=True)
             return
         session = bot.start_session(ctx.guild_id)
@@ -292,8 +550,6 @@ if __name__ == "__main__":
             await ctx.respond(stop_error, ephemeral=True)
             return
 
-        await ctx.trigger_typing()
-
         try:
             await _stop_recording_for_guild(bot, ctx)
             session = bot.stop_session(ctx.guild_id)
@@ -301,64 +557,58 @@ if __name__ == "__main__":
                 await ctx.respond("Recording stopped.", ephemeral=False)
                 return
 
-            stop_message, artifact_paths = _finalize_session_and_collect_artifacts(
-                bot, session
-            )
+            async with ctx.channel.typing():
+                stop_message, artifact_paths = await _finalize_session_and_collect_artifacts(
+                    bot, session
+                )
             await ctx.respond(stop_message, ephemeral=False)
-            await _post_session_artifacts(ctx.channel, session.session_id, artifact_paths)
+            await _post_session_artifacts(bot, ctx.channel, session.session_id, artifact_paths)
         finally:
             bot.cleanup_sink(ctx)
         
     @bot.slash_command(name="disconnect", description="Disconnect VOLO from your voice channel.")
     async def disconnect(ctx: discord.context.ApplicationContext):
         guild_id = ctx.guild_id
-        id_exists = bot.guild_to_helper.get(guild_id, None)
-        if not id_exists:
+        state = bot.guild_state.get(guild_id)
+        if not state:
             await ctx.respond("I am not connected in this server.", ephemeral=True)
             return
         
-        helper = bot.guild_to_helper[guild_id]    
-        bot_vc = helper.vc
+        helper = state.helper
+        bot_vc = state.vc
         
         if not bot_vc:
             await ctx.respond("I am not connected in this server.", ephemeral=True)
             return
         
-        await ctx.trigger_typing()
         await bot_vc.disconnect()
         helper.guild_id = None
         helper.set_vc(None)
-        bot.guild_to_helper.pop(guild_id, None)
+        bot.guild_state.pop(guild_id, None)
 
         await ctx.respond("Disconnected from voice channel.", ephemeral=False)
 
     @bot.slash_command(name="generate_pdf", description="Generate a PDF of the transcriptions.")
     async def generate_pdf(ctx: discord.context.ApplicationContext):
         guild_id = ctx.guild_id
-        helper = bot.guild_to_helper.get(guild_id, None)
-        if not helper:
+        if guild_id not in bot.guild_state:
             await ctx.respond("I am not connected to your voice channel.", ephemeral=True)
             return
         transcription = await bot.get_transcription(ctx)
         if not transcription:
             await ctx.respond("No transcription data available for PDF generation.", ephemeral=True)
             return
-        pdf_file_path = await pdf_generator(transcription)
+        async with ctx.channel.typing():
+            pdf_buffer = await pdf_generator(transcription)
         # Send the PDF as an attachment
-        if os.path.exists(pdf_file_path):
-            try:
-                with open(pdf_file_path, "rb") as f:
-                    discord_file = discord.File(f, filename=f"session_transcription.pdf")
-                    await ctx.respond("Here is the transcription from this session:", file=discord_file)
-            finally:
-                os.remove(pdf_file_path)
-        else:
-            await ctx.respond("No transcription file could be generated.", ephemeral=True)
+        discord_file = discord.File(pdf_buffer, filename="session_transcription.pdf")
+        await ctx.respond("Here is the transcription from this session:", file=discord_file)
 
 
     @bot.slash_command(name="update_player_map", description="Updates the player_map. If `PLAYER_MAP_FILE_PATH` is defined writes info to that location.")
     async def update_player_map(ctx: discord.context.ApplicationContext):
-        if bot.guild_is_recording.get(ctx.guild_id, False):
+        state = bot.guild_state.get(ctx.guild_id)
+        if state and state.is_recording:
             await ctx.respond("Cannot update player map while recording.", ephemeral=True)
             return
         try:
@@ -371,46 +621,47 @@ if __name__ == "__main__":
 
     @bot.slash_command(name="help", description="Show the help message.")
     async def help(ctx: discord.context.ApplicationContext):
-        embed_fields = [
-            discord.EmbedField(
-                name="/connect", value="Connect to your voice channel.", inline=True),
-            discord.EmbedField(
-                name="/disconnect", value="Disconnect from your voice channel.", inline=True),
-            discord.EmbedField(
-                name="/start_recording", value="Start transcribing the voice channel.", inline=True),
-            discord.EmbedField(
-                name="/stop_recording", value="Stop the active transcription.", inline=True),
-            discord.EmbedField(
-                name="/language", value="Set transcription language (auto/de/eng).", inline=True),
-            discord.EmbedField(
-                name="/generate_pdf", value="Generate a PDF of the transcriptions.", inline=True),
-            discord.EmbedField(
-                name="/help", value="Show the help message.", inline=True),
-        ]
-
-        embed = discord.Embed(title="VOLO Help",
-                              description="Available commands",
-                              color=discord.Color.blue(),
-                              fields=embed_fields)
-
-        await ctx.respond(embed=embed, ephemeral=True)
+        await ctx.respond(embed=_HELP_EMBED, ephemeral=True)
 
 
+if __name__ == "__main__":
+    args = CommandLine.read_command_line()
+    CLIArgs.update_from_args(args)
 
+    DISCORD_BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
+    if not DISCORD_BOT_TOKEN:
+        raise SystemExit("DISCORD_BOT_TOKEN not set")
+
+    transcription_listener = configure_logging()
+
+    # uvloop is a faster drop-in event loop; it is not available on Windows
     try:
-        loop.run_until_complete(bot.start(DISCORD_BOT_TOKEN))
-    except KeyboardInterrupt:
-        logger.info("^C received, shutting down...")
-        asyncio.run(bot.stop_and_cleanup())
-    finally:
-        # Close all connections
-        loop.run_until_complete(bot.close_consumers())
+        import uvloop
+        loop_factory = uvloop.new_event_loop
+    except ImportError:
+        loop_factory = None
+
+    from src.bot.volo_bot import VoloBot
 
-        tasks = [t for t in asyncio.all_tasks(loop) if not t.done()]
-        for task in tasks:
-            task.cancel()
-        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    async def main():
+        # The bot binds to the running loop, so it has to be created inside it
+        bot = VoloBot()
+        register_commands(bot)
+        try:
+            await bot.start(DISCORD_BOT_TOKEN)
+        except asyncio.CancelledError:
+            logger.info("^C received, shutting down...")
+            await bot.stop_and_cleanup()
+            raise
+        finally:
+            # Close all connections
+            await bot.close()
 
-        # Close the loop
-        loop.run_until_complete(bot.close())
-        loop.close()
+    try:
+        # The runner cancels any leftover tasks and closes the loop on exit
+        with asyncio.Runner(loop_factory=loop_factory) as runner:
+            runner.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        transcription_listener.stop()
@@ -1,13 +1,19 @@
 from __future__ import annotations
 
+import functools
+import itertools
 import re
 from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
+from typing import TextIO
 from zoneinfo import ZoneInfo
 
 
 BERLIN_TZ = ZoneInfo("Europe/Berlin")
+_UNSAFE_FILENAME_RE = re.compile(r"[^a-zA-Z0-9._-]+")
+# Keeps ids unique when two sessions start within the same second
+_SESSION_COUNTER = itertools.count()
 
 
 @dataclass
@@ -17,16 +23,20 @@ class SessionContext:
     chunks_dir: Path
     audio_dir: Path
     chunk_index: int = 0
-    transcript_lines: list[str] = field(default_factory=list)
+    transcript_fh: TextIO | None = None
     display_names: dict[int, str] = field(default_factory=dict)
+    # Per-user chunk path prefix; an entry also means the user's dir exists
+    chunk_prefixes: dict[int, str] = field(default_factory=dict)
+    timestamps: list[str] = field(default_factory=list)
 
 
 def create_session_id() -> str:
-    return datetime.now(BERLIN_TZ).strftime("%Y-%m-%d_%H-%M-%S")
+    return f"{datetime.now(BERLIN_TZ):%Y-%m-%d_%H-%M-%S}_{next(_SESSION_COUNTER):04d}"
 
 
+@functools.lru_cache(maxsize=1024)
 def safe_filename(name: str) -> str:
-    sanitized = re.sub(r"[^a-zA-Z0-9._-]+", "_", name.strip())
+    sanitized = _UNSAFE_FILENAME_RE.sub("_", name.strip())
     sanitized = sanitized.strip("._")
     return sanitized or "unknown"
 
@@ -36,8 +46,10 @@ def init_session(base_dir: str = "/data/sessions") -> SessionContext:
     session_dir = Path(base_dir) / session_id
     chunks_dir = session_dir / "chunks"
     audio_dir = session_dir / "audio"
-    chunks_dir.mkdir(parents=True, exist_ok=True)
-    audio_dir.mkdir(parents=True, exist_ok=True)
+    # Walk the ancestors once; the leaves then only need a single mkdir each
+    session_dir.mkdir(parents=True, exist_ok=True)
+    chunks_dir.mkdir(exist_ok=True)
+    audio_dir.mkdir(exist_ok=True)
     return SessionContext(
         session_id=session_id,
         session_dir=session_dir,
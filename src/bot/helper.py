@@ -2,6 +2,7 @@ import asyncio
 import io
 import logging
 from base64 import b64decode
+from dataclasses import dataclass
 
 import discord
 
@@ -64,4 +65,19 @@ class BotHelper:
                 await self.bot.get_guild(self.guild_id).get_member(self.bot.user.id).edit(nick=BOT_NAME)
         except Exception as e:
             logger.error(f"Error updating status: {e}")
-            logger.error(f"Data: {update}")
\ No newline at end of file
+            logger.error(f"Data: {update}")
+
+
+@dataclass(slots=True)
+class GuildState:
+    """
+    Connection and recording state for a single guild.
+    """
+
+    helper: BotHelper
+    is_recording: bool = False
+    artifact_webhook: discord.Webhook | None = None
+
+    @property
+    def vc(self):
+        return self.helper.vc
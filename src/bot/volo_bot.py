@@ -1,5 +1,4 @@
 import asyncio
-import base64
 import logging
 import os
 from pathlib import Path
@@ -7,8 +6,9 @@ from pathlib import Path
 import discord
 import yaml
 
-from recording.ffmpeg_tools import concat_wavs_to_opus_ogg, mix_opus_ogg
+from recording.ffmpeg_tools import concat_and_mix
 from recording.session import SessionContext, init_session, safe_filename
+from src.bot.helper import GuildState
 from src.sinks.whisper_sink import WhisperSink
 
 DISCORD_CHANNEL_ID = int(os.getenv("DISCORD_CHANNEL_ID", "0"))
@@ -16,22 +16,32 @@ TRANSCRIPTION_METHOD = os.getenv("TRANSCRIPTION_METHOD")
 PLAYER_MAP_FILE_PATH = os.getenv("PLAYER_MAP_FILE_PATH")
 CHUNK_SECONDS = int(os.getenv("CHUNK_SECONDS", "30"))
 TRANSCRIPTION_LANGUAGE = os.getenv("TRANSCRIPTION_LANGUAGE", "auto")
+TRANSCRIPTION_BATCH_SIZE = 32
+# libyaml's parser/emitter when PyYAML was built with it, the pure-Python ones otherwise
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
 
 logger = logging.getLogger(__name__)
 
 
+def _write_bytes(path: str, data: bytes) -> None:
+    with open(path, "wb") as file:
+        file.write(data)
+
+
 class VoloBot(discord.Bot):
-    def __init__(self, loop):
+    def __init__(self):
 
-        super().__init__(command_prefix="!", loop=loop,
+        super().__init__(command_prefix="!",
                          activity=discord.CustomActivity(name='Transcribing Audio to Text'))
-        self.guild_to_helper = {}
-        self.guild_is_recording = {}
+        self.guild_state: dict[int, GuildState] = {}
         self.guild_whisper_sinks = {}
         self.guild_whisper_message_tasks = {}
+        self.guild_transcriptions: dict[int, list] = {}
         self.guild_transcription_languages: dict[int, str] = {}
         self.active_sessions: dict[int, SessionContext] = {}
         self.player_map = {}
+        self.command_ids: dict[str, int] = {}
         self._is_ready = False
         self.default_transcription_language = WhisperSink.normalize_transcription_language(
             TRANSCRIPTION_LANGUAGE
@@ -42,14 +52,24 @@ class VoloBot(discord.Bot):
             self.transcriber_type = "local"
         if PLAYER_MAP_FILE_PATH:
             with open(PLAYER_MAP_FILE_PATH, "r", encoding="utf-8") as file:
-                self.player_map = yaml.safe_load(file)
+                self.player_map = yaml.load(file, Loader=_YAML_LOADER)
 
     async def on_ready(self):
         logger.info(f"Logged in as {self.user} to Discord.")
+        # Command sync runs in its own task and may not have finished yet;
+        # ids still missing are looked up on first use in get_command_id
+        self.command_ids = {
+            cmd.name: cmd.id for cmd in self.application_commands if cmd.id is not None
+        }
         self._is_ready = True
 
-    async def close_consumers(self):
-        await self.consumer_manager.close()
+    def get_command_id(self, name: str) -> int | None:
+        command_id = self.command_ids.get(name)
+        if command_id is None:
+            command = self.get_application_command(name)
+            if command and command.id is not None:
+                command_id = self.command_ids[name] = command.id
+        return command_id
 
     def _close_and_clean_sink_for_guild(self, guild_id: int):
         whisper_sink: WhisperSink | None = self.guild_whisper_sinks.get(
@@ -60,6 +80,27 @@ class VoloBot(discord.Bot):
             whisper_sink.stop_voice_thread()
             del self.guild_whisper_sinks[guild_id]
             whisper_sink.close()
+            # Detach the consumer and its texts now, so a new recording starts clean;
+            # it still handles what the sink had queued before it is cancelled.
+            # May be called from the voice thread, hence run_coroutine_threadsafe.
+            asyncio.run_coroutine_threadsafe(
+                self._retire_transcription_consumer(
+                    whisper_sink.transcription_output_queue,
+                    self.guild_whisper_message_tasks.pop(guild_id, None),
+                ),
+                self.loop,
+            )
+            self.guild_transcriptions.pop(guild_id, None)
+
+    async def _retire_transcription_consumer(
+        self, queue: asyncio.Queue, task: asyncio.Task | None
+    ):
+        if task is None:
+            return
+        if not task.done():
+            await queue.join()
+        logger.debug("Cancelling whisper message task.")
+        task.cancel()
 
     def start_recording(self, ctx: discord.context.ApplicationContext):
         """
@@ -71,7 +112,7 @@ class VoloBot(discord.Bot):
         """
         try:
             self.start_whisper_sink(ctx)
-            self.guild_is_recording[ctx.guild_id] = True
+            self.guild_state[ctx.guild_id].is_recording = True
         except Exception as e:
             logger.error(f"Error starting whisper sink: {e}")
 
@@ -99,7 +140,7 @@ class VoloBot(discord.Bot):
             player_map=self.player_map,
         )
 
-        self.guild_to_helper[ctx.guild_id].vc.start_recording(
+        self.guild_state[ctx.guild_id].vc.start_recording(
             whisper_sink, on_stop_record_callback, ctx)
 
         def on_thread_exception(e):
@@ -113,19 +154,26 @@ class VoloBot(discord.Bot):
         whisper_sink.start_voice_thread(on_exception=on_thread_exception)
 
         self.guild_whisper_sinks[ctx.guild_id] = whisper_sink
+        self._cancel_transcription_consumer(ctx.guild_id)
+        transcriptions = self.guild_transcriptions[ctx.guild_id] = []
+        self.guild_whisper_message_tasks[ctx.guild_id] = asyncio.create_task(
+            self._consume_transcriptions(ctx, whisper_sink, transcriptions)
+        )
 
     def stop_recording(self, ctx: discord.context.ApplicationContext):
         vc = ctx.guild.voice_client
         if vc:
-            self.guild_is_recording[ctx.guild_id] = False
+            state = self.guild_state.get(ctx.guild_id)
+            if state:
+                state.is_recording = False
             vc.stop_recording()
-        guild_id = ctx.guild_id
-        whisper_message_task = self.guild_whisper_message_tasks.get(
+
+    def _cancel_transcription_consumer(self, guild_id: int):
+        whisper_message_task = self.guild_whisper_message_tasks.pop(
             guild_id, None)
         if whisper_message_task:
             logger.debug("Cancelling whisper message task.")
             whisper_message_task.cancel()
-            del self.guild_whisper_message_tasks[guild_id]
 
     def cleanup_sink(self, ctx: discord.context.ApplicationContext):
         guild_id = ctx.guild_id
@@ -154,66 +202,182 @@ class VoloBot(discord.Bot):
             return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
         return f"{minutes:02d}:{seconds:02d}"
 
-    async def _resolve_display_name(self, guild: discord.Guild, user_id: int) -> str:
+    def _chunk_timestamp(self, session: SessionContext, index: int) -> str:
+        # Chunk offsets only ever grow, so each timestamp string is formatted once per session
+        timestamps = session.timestamps
+        while len(timestamps) <= index:
+            timestamps.append(self._format_timestamp(len(timestamps) * CHUNK_SECONDS))
+        return timestamps[index]
+
+    async def _resolve_display_name(
+        self, guild: discord.Guild, user_id: int, cache: dict[int, str] | None = None
+    ) -> str:
+        if cache is not None and user_id in cache:
+            return cache[user_id]
+
         member = guild.get_member(user_id)
         if member:
-            return member.display_name
+            display_name = member.display_name
+        else:
+            try:
+                member = await guild.fetch_member(user_id)
+                display_name = member.display_name
+            except Exception:
+                # Cached as well, so a failed lookup is not retried for every chunk
+                display_name = str(user_id)
+
+        if cache is not None:
+            cache[user_id] = display_name
+        return display_name
+
+    async def _prefetch_display_names(
+        self, guild: discord.Guild, items: list, cache: dict[int, str]
+    ) -> None:
+        """Look up every unknown speaker of a batch with one member query."""
+        missing = []
+        for item in items:
+            payload = item.get("log", {})
+            if item.get("display_name") or not (payload.get("data") or "").strip():
+                continue
+            user_id = int(payload.get("user_id"))
+            if user_id not in cache and user_id not in missing and guild.get_member(user_id) is None:
+                missing.append(user_id)
+        if not missing:
+            return
         try:
-            member = await guild.fetch_member(user_id)
-            return member.display_name
-        except Exception:
-            return str(user_id)
+            members = await guild.query_members(user_ids=missing[:100], limit=100)
+        except Exception as e:
+            # e.g. without the members intent; _resolve_display_name fetches one by one
+            logger.debug(f"Batched member lookup failed for guild {guild.id}: {e}")
+            return
+        for member in members:
+            cache[member.id] = member.display_name
 
-    async def _handle_transcription_item(self, ctx: discord.context.ApplicationContext, item: dict):
+    async def _handle_transcription_item(
+        self, ctx: discord.context.ApplicationContext, item: dict
+    ) -> str | None:
+        """Store the chunk audio and return its transcript line, if it belongs in one."""
         session = self.active_sessions.get(ctx.guild_id)
         if not session:
-            return
+            return None
 
-        payload = item.get("log", {}) if isinstance(item, dict) else {}
+        payload = item.get("log", {})
         text = (payload.get("data") or "").strip()
         if not text:
-            return
+            return None
 
         user_id = int(payload.get("user_id"))
         session.chunk_index += 1
         chunk_number = session.chunk_index
 
-        wav_b64 = item.get("wav_b64", "")
-        if wav_b64:
-            user_dir = session.chunks_dir / str(user_id)
-            user_dir.mkdir(parents=True, exist_ok=True)
-            chunk_path = user_dir / f"chunk_{chunk_number:04d}.wav"
-            chunk_path.write_bytes(base64.b64decode(wav_b64))
-
-        display_name = await self._resolve_display_name(ctx.guild, user_id)
-        session.display_names[user_id] = display_name
-
-        t_seconds = (chunk_number - 1) * CHUNK_SECONDS
-        timestamp = self._format_timestamp(t_seconds)
-        session.transcript_lines.append(f"[{timestamp}] {display_name}: {text}")
+        wav_bytes = item.get("wav", b"")
+        if wav_bytes:
+            prefix = session.chunk_prefixes.get(user_id)
+            if prefix is None:
+                user_dir = session.chunks_dir / str(user_id)
+                user_dir.mkdir(parents=True, exist_ok=True)
+                prefix = session.chunk_prefixes[user_id] = f"{user_dir}{os.sep}chunk_"
+            await asyncio.to_thread(_write_bytes, f"{prefix}{chunk_number:04d}.wav", wav_bytes)
+
+        # The sink fills in the player map name; only unmapped users need a lookup
+        display_name = item.get("display_name")
+        if display_name:
+            session.display_names.setdefault(user_id, display_name)
+        else:
+            display_name = await self._resolve_display_name(
+                ctx.guild, user_id, session.display_names
+            )
+
+        timestamp = self._chunk_timestamp(session, chunk_number - 1)
+        return f"[{timestamp}] {display_name}: {text}\n"
+
+    async def _consume_transcriptions(
+        self,
+        ctx: discord.context.ApplicationContext,
+        whisper_sink: WhisperSink,
+        transcriptions: list,
+    ):
+        """Handle sink output while recording, in batches of whatever has queued up."""
+        queue = whisper_sink.transcription_output_queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < TRANSCRIPTION_BATCH_SIZE:
+                try:
+                    batch.append(queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            # Dequeued items free their slots right away, so the sink never waits on handling
+            for _ in batch:
+                whisper_sink.output_slots.release()
+            try:
+                await self._process_transcription_items(ctx, batch, transcriptions)
+            except Exception as e:
+                logger.error(f"Error handling transcriptions for guild {ctx.guild_id}: {e}")
+            finally:
+                for _ in batch:
+                    queue.task_done()
 
     async def get_transcription(self, ctx: discord.context.ApplicationContext):
-        # Get the transcription queue
-        if not (self.guild_whisper_sinks.get(ctx.guild_id)):
-            return
-        whisper_sink = self.guild_whisper_sinks[ctx.guild_id]
-        transcriptions = []
+        whisper_sink = self.guild_whisper_sinks.get(ctx.guild_id)
         if whisper_sink is None:
             return
 
-        transcriptions_queue = whisper_sink.transcription_output_queue
-        while not transcriptions_queue.empty():
-            item = await transcriptions_queue.get()
-            if isinstance(item, dict):
-                await self._handle_transcription_item(ctx, item)
-                log_payload = item.get("log", {})
-                transcriptions.append(log_payload.get("data", ""))
-            else:
-                transcriptions.append(item)
+        # Taken before waiting, as the sink may be cleaned up in the meantime
+        pending = self.guild_transcriptions.get(ctx.guild_id, [])
+        # The consumer task handles every item; wait until it has caught up
+        await whisper_sink.transcription_output_queue.join()
+        transcriptions = pending[:]
+        pending.clear()
         return transcriptions
 
+    async def _process_transcription_items(
+        self,
+        ctx: discord.context.ApplicationContext,
+        items: list,
+        transcriptions: list,
+    ):
+        session = self.active_sessions.get(ctx.guild_id)
+        if session:
+            await self._prefetch_display_names(ctx.guild, items, session.display_names)
+
+        # The sink only ever enqueues dicts, so items need no type check.
+        # Display names resolve concurrently; lines are still written in queue order
+        results = await asyncio.gather(
+            *(self._handle_transcription_item(ctx, item) for item in items),
+            return_exceptions=True,
+        )
+        transcript_lines = []
+        for item, result in zip(items, results):
+            if isinstance(result, Exception):
+                logger.error(
+                    f"Error handling transcription of user "
+                    f"{item.get('log', {}).get('user_id')} for guild {ctx.guild_id}: {result}"
+                )
+                continue
+            if result:
+                transcript_lines.append(result)
+            transcriptions.append(item.get("log", {}).get("data", ""))
+
+        if session and session.transcript_fh and transcript_lines:
+            await asyncio.to_thread(session.transcript_fh.writelines, transcript_lines)
+
+    @staticmethod
+    def _close_transcript(session: SessionContext) -> None:
+        if session.transcript_fh:
+            transcript_fh, session.transcript_fh = session.transcript_fh, None
+            transcript_fh.close()
+
     def start_session(self, guild_id: int) -> SessionContext:
+        previous = self.active_sessions.get(guild_id)
+        if previous:
+            # An abandoned session (e.g. after a disconnect) still holds its transcript open
+            self._close_transcript(previous)
         session = init_session(base_dir="/data/sessions")
+        # Lines are appended as they arrive instead of being held until finalize
+        session.transcript_fh = open(
+            session.session_dir / "transcript.md", "w", encoding="utf-8"
+        )
+        session.transcript_fh.write(f"# Transcript – {session.session_id}\n\n")
         self.active_sessions[guild_id] = session
         logger.info("Session started for guild %s: %s", guild_id, session.session_id)
         return session
@@ -221,22 +385,29 @@ class VoloBot(discord.Bot):
     def stop_session(self, guild_id: int) -> SessionContext | None:
         return self.active_sessions.pop(guild_id, None)
 
-    def finalize_session(self, session: SessionContext) -> None:
-        transcript_path = session.session_dir / "transcript.md"
-        transcript_content = [f"# Transcript – {session.session_id}", ""]
-        transcript_content.extend(session.transcript_lines)
-        transcript_path.write_text("\n".join(transcript_content) + "\n", encoding="utf-8")
+    async def finalize_session(self, session: SessionContext) -> None:
+        await asyncio.to_thread(self._close_transcript, session)
+
+        # Scanning the resolved dir yields absolute paths that ffmpeg can take as-is
+        with os.scandir(session.chunks_dir.resolve()) as entries:
+            user_dirs = sorted((e for e in entries if e.is_dir()), key=lambda e: e.name)
 
+        user_wavs: list[list[str]] = []
         user_outputs: list[Path] = []
-        for user_dir in sorted(p for p in session.chunks_dir.iterdir() if p.is_dir()):
-            wavs = sorted(user_dir.glob("chunk_*.wav"))
+        for user_dir in user_dirs:
+            with os.scandir(user_dir.path) as entries:
+                wavs = sorted(
+                    e.path
+                    for e in entries
+                    if e.name.startswith("chunk_") and e.name.endswith(".wav")
+                )
             if not wavs:
                 continue
             user_id = int(user_dir.name)
             display_name = session.display_names.get(user_id, str(user_id))
             safe_name = safe_filename(display_name)
             out_ogg = session.audio_dir / f"user_{user_id}_{safe_name}_full.ogg"
-            concat_wavs_to_opus_ogg(wavs, out_ogg, bitrate="32k")
+            user_wavs.append(wavs)
             user_outputs.append(out_ogg)
 
         if not user_outputs:
@@ -244,37 +415,68 @@ class VoloBot(discord.Bot):
             return
 
         mixed_out = session.audio_dir / "mixed_full.ogg"
-        mix_opus_ogg(user_outputs, mixed_out, bitrate="48k")
+        await concat_and_mix(user_wavs, user_outputs, mixed_out, user_bitrate="32k", mix_bitrate="48k")
 
     def get_session_artifact_paths(self, session: SessionContext) -> list[Path]:
         artifacts = [
-            session.session_dir / "transcript.md",
-            session.audio_dir / "mixed_full.ogg",
+            path
+            for path in (
+                session.session_dir / "transcript.md",
+                session.audio_dir / "mixed_full.ogg",
+            )
+            if path.exists()
         ]
+        # glob only yields files that exist, so these need no extra stat
         artifacts.extend(sorted(session.audio_dir.glob("user_*_full.ogg")))
-        return [path for path in artifacts if path.exists()]
+        return artifacts
 
     async def update_player_map(self, ctx: discord.context.ApplicationContext):
-        player_map = {}
+        changes = {}
         for member in ctx.guild.members:
-            player_map[member.id] = {
+            entry = {
                 "player": member.name,
                 "character": member.display_name
             }
-        logger.info(f"{str(player_map)}")
-        self.player_map.update(player_map)
+            if self.player_map.get(member.id) != entry:
+                changes[member.id] = entry
+        if not changes:
+            return
+        logger.info(f"{str(changes)}")
+        self.player_map.update(changes)
         if PLAYER_MAP_FILE_PATH:
-            with open(PLAYER_MAP_FILE_PATH, "w", encoding="utf-8") as file:
-                yaml.dump(self.player_map, file, default_flow_style=False, allow_unicode=True)
+            await asyncio.to_thread(self._write_player_map, dict(self.player_map))
+
+    @staticmethod
+    def _write_player_map(player_map: dict) -> None:
+        with open(PLAYER_MAP_FILE_PATH, "w", encoding="utf-8") as file:
+            yaml.dump(
+                player_map,
+                file,
+                Dumper=_YAML_DUMPER,
+                default_flow_style=False,
+                allow_unicode=True,
+            )
 
     async def stop_and_cleanup(self):
         try:
-            for sink in self.guild_whisper_sinks.values():
-                sink.close()
-                sink.stop_voice_thread()
-                logger.debug(
-                    f"Stopped whisper sink for guild {sink.vc.channel.guild.id} in cleanup.")
+            for guild_id in list(self.guild_whisper_message_tasks):
+                self._cancel_transcription_consumer(guild_id)
+            self.guild_transcriptions.clear()
+            for session in self.active_sessions.values():
+                self._close_transcript(session)
+            sinks = list(self.guild_whisper_sinks.values())
             self.guild_whisper_sinks.clear()
+            # Each stop joins a voice thread, so the sinks are shut down side by side
+            results = await asyncio.gather(
+                *(asyncio.to_thread(sink.close_and_stop) for sink in sinks),
+                return_exceptions=True,
+            )
+            for sink, result in zip(sinks, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Error stopping whisper sink: {result}")
+                else:
+                    logger.debug(
+                        f"Stopped whisper sink for guild {sink.vc.channel.guild.id} in cleanup.")
         except Exception as e:
             logger.error(f"Error stopping whisper sinks: {e}")
         finally:
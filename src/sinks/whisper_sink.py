@@ -1,5 +1,4 @@
 import asyncio
-import base64
 import io
 import json
 import logging
@@ -21,6 +20,8 @@ from openai import OpenAI
 WHISPER_MODEL = "small"
 DEFAULT_TRANSCRIPTION_LANGUAGE = os.getenv("WHISPER_LANGUAGE", "auto")
 WHISPER__PRECISION = "int8"
+# Caps how many finished chunks may wait for the bot before the voice thread blocks
+TRANSCRIPTION_QUEUE_MAXSIZE = 256
 
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
@@ -77,7 +78,10 @@ class WhisperSink(Sink):
         max_speakers=-1,
     ):
         self.queue = transcript_queue
-        self.transcription_output_queue = asyncio.Queue()
+        self.transcription_output_queue = asyncio.Queue(maxsize=TRANSCRIPTION_QUEUE_MAXSIZE)
+        # Held per queued item and released by the consumer, so the voice thread can tell
+        # the queue is full without waiting on the event loop
+        self.output_slots = threading.BoundedSemaphore(TRANSCRIPTION_QUEUE_MAXSIZE)
         self.loop = loop
 
         if filters is None:
@@ -360,12 +364,19 @@ class WhisperSink(Sink):
         transcription_logger = logging.getLogger('transcription')
         # Log the message
         transcription_logger.info(log_message)
+        # Only waits while the queue is full
+        while not self.output_slots.acquire(timeout=0.5):
+            # stop_voice_thread joins this thread from the loop, so never outwait a stop
+            if not self.running:
+                logger.warning(f"Dropped transcription for user {speaker.user} on shutdown.")
+                return
         # Place into queue for processing
         self.loop.call_soon_threadsafe(
             self.transcription_output_queue.put_nowait,
             {
                 "log": log_data,
-                "wav_b64": base64.b64encode(wav_bytes).decode("ascii"),
+                "wav": wav_bytes,
+                "display_name": speaker.character,
             },
         )
     
@@ -388,3 +399,8 @@ class WhisperSink(Sink):
         self.running = False
         self.queue.put_nowait(None)
         super().cleanup()
+
+    def close_and_stop(self):
+        """Close the sink and wait for its voice thread; blocking, so run it off the loop."""
+        self.close()
+        self.stop_voice_thread()
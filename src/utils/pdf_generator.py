@@ -1,6 +1,8 @@
+import asyncio
+import io
 import json
 import os
-import tempfile
+from typing import IO
 
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
@@ -15,24 +17,20 @@ def add_parchment_background(c, doc):
     background_path = os.path.join('assets', 'parchment_background.jpg')
     c.drawImage(background_path, 0, 0, width=A4[0], height=A4[1], mask='auto')
 
-async def pdf_generator(transcriptions, logo_path=None):
+async def pdf_generator(transcriptions, logo_path=None, out: IO[bytes] | None = None):
     """
     Generates a PDF with aligned transcription columns, wrapping long data entries, and reduced margins.
     
     :param transcriptions: List of transcriptions to include in the PDF.
     :param logo_path: Optional path to a logo image to include in the PDF.
-    :return: Path to the generated PDF file.
+    :param out: Optional writable binary buffer to render into. A new BytesIO is used if omitted.
+    :return: The buffer holding the generated PDF, rewound to the start.
     """
-    # Ensure the logs directory exists
-    logs_dir = "./.logs/pdfs"
-    os.makedirs(logs_dir, exist_ok=True)
-
-    # Create a temporary file in the logs directory
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=logs_dir) as tmp_file:
-        pdf_file_path = tmp_file.name
+    if out is None:
+        out = io.BytesIO()
 
     # Set up the PDF document with reduced margins
-    doc = SimpleDocTemplate(pdf_file_path, pagesize=A4,
+    doc = SimpleDocTemplate(out, pagesize=A4,
                             leftMargin=0.5 * inch, rightMargin=0.5 * inch, topMargin=1 * inch, bottomMargin=1 * inch)
     elements = []
 
@@ -86,6 +84,9 @@ async def pdf_generator(transcriptions, logo_path=None):
 
     # Add a watermark or subtle background elements (optional)
     watermark_text = "Generated by V.O.L.O"
-    doc.build(elements, onFirstPage=add_parchment_background, onLaterPages=add_parchment_background)
+    # Rendering reads the background image and lays out every page, so keep it off the event loop
+    await asyncio.to_thread(doc.build, elements,
+                            onFirstPage=add_parchment_background, onLaterPages=add_parchment_background)
 
-    return pdf_file_path
+    out.seek(0)
+    return out